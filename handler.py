@@ -1,10 +1,22 @@
 import os
+import re
 import json
+try:
+    import orjson
+except ImportError:  # wheel ausente o compilado para otra plataforma
+    orjson = None
 import requests
+from requests.adapters import HTTPAdapter
 import boto3
+from boto3.dynamodb.types import TypeSerializer
+from botocore.config import Config
+from botocore.exceptions import ClientError
+import time
+import queue
 import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 from datetime import datetime, timezone
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
 
 # -----------------------
 # CONFIG
@@ -13,9 +25,34 @@ TABLE_NAME = os.environ.get("TABLE_NAME", "TablaWebScrapping")
 AWS_REGION = "us-east-1"
 DEFAULT_START_YEAR = int(os.environ.get("START_YEAR", "2025"))
 DEFAULT_END_YEAR = int(os.environ.get("END_YEAR", str(DEFAULT_START_YEAR)))
+SCAN_SEGMENTS = 8
+INSERT_WORKERS = 8
+DELETE_WORKERS = 8
+DELETE_QUEUE_SIZE = 32
+BATCH_SIZE = 25
+MAX_BATCH_RETRIES = 8
 
-dynamodb = boto3.resource("dynamodb", region_name=AWS_REGION)
-table = dynamodb.Table(TABLE_NAME)
+_CFG = Config(
+    region_name=AWS_REGION,
+    max_pool_connections=50,
+    tcp_keepalive=True,
+    retries={"max_attempts": 10, "mode": "adaptive"},
+)
+
+# Sesión HTTP reutilizada entre invocaciones "calientes" de Lambda (keep-alive)
+_ADAPTER = HTTPAdapter(pool_connections=2, pool_maxsize=10, max_retries=2)
+SESSION = requests.Session()
+SESSION.mount("https://", _ADAPTER)
+
+_CLIENT = None
+_SERIALIZER = TypeSerializer()
+
+def _get_client():
+    """Cliente DynamoDB de bajo nivel, creado una sola vez por contenedor."""
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = boto3.client("dynamodb", config=_CFG)
+    return _CLIENT
 
 # -----------------------
 # LOGGING
@@ -29,18 +66,31 @@ def error_log(msg, *args):
 # -----------------------
 # UTILITIES
 # -----------------------
+_ISO_RE = re.compile(
+    r"(\d{4})-(\d{1,2})-(\d{1,2})T(\d{1,2}):(\d{1,2}):(\d{1,2})(?:\.(\d{1,6}))?Z"
+)
+
 def parse_iso_z(s):
-    if not s:
+    if not s or not isinstance(s, str):
         return None
     try:
         return datetime.fromisoformat(s.replace("Z", "+00:00"))
-    except Exception:
-        for fmt in ("%Y-%m-%dT%H:%M:%S.%fZ", "%Y-%m-%dT%H:%M:%SZ"):
-            try:
-                return datetime.strptime(s, fmt).replace(tzinfo=timezone.utc)
-            except Exception:
-                continue
-    return None
+    except ValueError:
+        pass
+    # Formatos que fromisoformat no acepta (p. ej. fracción de 1-2 dígitos)
+    m = _ISO_RE.fullmatch(s)
+    if not m:
+        return None
+    y, mo, d, h, mi, sec, frac = m.groups()
+    try:
+        return datetime(int(y), int(mo), int(d), int(h), int(mi), int(sec),
+                        int(frac.ljust(6, "0")) if frac else 0, tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+def _to_z(dt):
+    """Formatea un datetime en UTC como isoformat() con sufijo "Z" en lugar de "+00:00"."""
+    return (dt if dt.tzinfo is timezone.utc else dt.astimezone(timezone.utc)).isoformat()[:-6] + "Z"
 
 def unir_fecha_hora(fecha_str, hora_str):
     fecha = parse_iso_z(fecha_str)
@@ -48,13 +98,13 @@ def unir_fecha_hora(fecha_str, hora_str):
     if not fecha:
         return None
     if not hora:
-        return fecha.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+        return _to_z(fecha)
     try:
         nueva = fecha.replace(hour=hora.hour, minute=hora.minute,
                               second=hora.second, microsecond=hora.microsecond)
-        return nueva.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+        return _to_z(nueva)
     except Exception:
-        return fecha.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+        return _to_z(fecha)
 
 def convert_item_to_decimal(item):
     """Convierte floats, ints y strings numéricos a Decimal para DynamoDB."""
@@ -77,40 +127,162 @@ def convert_item_to_decimal(item):
     else:
         return item
 
+def _valor_a_decimal(v):
+    if isinstance(v, (float, int, str)):
+        try:
+            return Decimal(v if isinstance(v, str) else str(v))
+        except (InvalidOperation, ValueError):
+            return v  # p. ej. bool o texto no numérico: se conserva tal cual
+    if isinstance(v, dict):
+        return convert_item_to_decimal_inplace(v)
+    if isinstance(v, list):
+        v[:] = [_valor_a_decimal(x) for x in v]
+    return v
+
+def convert_item_to_decimal_inplace(item):
+    """Como convert_item_to_decimal, pero modifica el dict recibido (y los anidados)
+    sin copiarlo. Los valores que no se pueden convertir se conservan en todos los niveles."""
+    for k, v in item.items():
+        item[k] = _valor_a_decimal(v)
+    return item
+
+def json_loads(raw):
+    return orjson.loads(raw) if orjson else json.loads(raw)
+
+def json_dumps(data):
+    return orjson.dumps(data).decode() if orjson else json.dumps(data, ensure_ascii=False)
+
 # -----------------------
 # DYNAMODB
 # -----------------------
+def _batch_write(requests_):
+    """Envía un BatchWriteItem reintentando UnprocessedItems con backoff exponencial."""
+    pending = {TABLE_NAME: requests_}
+    for intento in range(MAX_BATCH_RETRIES):
+        resp = _get_client().batch_write_item(
+            RequestItems=pending,
+            ReturnConsumedCapacity="NONE",
+            ReturnItemCollectionMetrics="NONE",
+        )
+        pending = resp.get("UnprocessedItems") or {}
+        if not pending:
+            return
+        if intento < MAX_BATCH_RETRIES - 1:
+            time.sleep(min(0.05 * (2 ** intento), 2))
+    raise RuntimeError(f"UnprocessedItems tras {MAX_BATCH_RETRIES} intentos")
+
+_FIN = object()
+
+def _producir_claves(q, segment, total_segments):
+    """Pagina un segmento del scan (solo "id") y encola las claves de 25 en 25."""
+    paginator = _get_client().get_paginator("scan")
+    pages = paginator.paginate(
+        TableName=TABLE_NAME,
+        Segment=segment,
+        TotalSegments=total_segments,
+        Select="SPECIFIC_ATTRIBUTES",
+        ProjectionExpression="#i",
+        ExpressionAttributeNames={"#i": "id"},
+        ReturnConsumedCapacity="NONE",
+    )
+    for page in pages:
+        # Las claves ya vienen serializadas ({"id": {"S": ...}}), se reenvían tal cual
+        keys = [it["id"] for it in page.get("Items", []) if "id" in it]
+        for i in range(0, len(keys), BATCH_SIZE):
+            q.put(keys[i:i + BATCH_SIZE])
+
+def _consumir_borrados(q):
+    """Elimina los lotes de claves de la cola hasta recibir _FIN."""
+    deleted = 0
+    error = None
+    while True:
+        chunk = q.get()
+        if chunk is _FIN:
+            break
+        if error is not None:
+            continue  # se sigue vaciando la cola para no bloquear a los productores
+        try:
+            _batch_write([{"DeleteRequest": {"Key": {"id": k}}} for k in chunk])
+            deleted += len(chunk)
+        except Exception as e:
+            error = e
+    if error is not None:
+        raise error
+    return deleted
+
 def limpiar_tabla():
     log("Limpiando tabla DynamoDB...")
-    resp = table.scan()
-    items = resp.get("Items", [])
-    total_deleted = 0
-
-    while items:
-        with table.batch_writer() as batch:
-            for it in items:
-                if "id" in it:
-                    batch.delete_item(Key={"id": it["id"]})
-                    total_deleted += 1
-        if 'LastEvaluatedKey' in resp:
-            resp = table.scan(ExclusiveStartKey=resp['LastEvaluatedKey'])
-            items = resp.get("Items", [])
-        else:
-            break
+    q = queue.Queue(maxsize=DELETE_QUEUE_SIZE)
+    with ThreadPoolExecutor(max_workers=SCAN_SEGMENTS + DELETE_WORKERS) as ex:
+        consumers = [ex.submit(_consumir_borrados, q) for _ in range(DELETE_WORKERS)]
+        producers = [ex.submit(_producir_claves, q, seg, SCAN_SEGMENTS)
+                     for seg in range(SCAN_SEGMENTS)]
+        wait(producers)
+        for _ in consumers:
+            q.put(_FIN)
+        for f in producers:
+            f.result()
+        total_deleted = sum(f.result() for f in consumers)
 
     log(f"Tabla limpiada. Items eliminados: {total_deleted}")
 
-def insertar_items(items):
-    log(f"Insertando {len(items)} items en DynamoDB...")
-    count = 0
-    for item in items:
+def _es_error_de_item(e):
+    """True si el ClientError lo causa el contenido de algún item y no el servicio."""
+    return e.response.get("Error", {}).get("Code") == "ValidationException"
+
+def _insertar_shard(items):
+    """Inserta un subconjunto de items vía BatchWriteItem (el último id repetido gana)."""
+    unicos = {str(item.get("id")): item for item in items}
+    puts = []
+    for item in unicos.values():
         try:
-            item = convert_item_to_decimal(item)
-            table.put_item(Item=item)
-            count += 1
-            log(f"Insert OK: {item.get('id')}")
+            puts.append({"PutRequest": {"Item": {k: _SERIALIZER.serialize(v)
+                                                 for k, v in item.items()}}})
         except Exception as e:
             error_log(f"Error insertando item {item}: {e}")
+
+    count = 0
+    for i in range(0, len(puts), BATCH_SIZE):
+        lote = puts[i:i + BATCH_SIZE]
+        try:
+            _batch_write(lote)
+            count += len(lote)
+        except ClientError as e:
+            if not _es_error_de_item(e):
+                error_log(f"Error insertando lote de {len(lote)} items, se omite: {e}")
+                continue
+            # Un item inválido hace fallar todo el lote: se reintenta uno a uno
+            error_log(f"Error insertando lote de {len(lote)} items, reintentando uno a uno: {e}")
+            for put in lote:
+                try:
+                    _batch_write([put])
+                    count += 1
+                except ClientError as e:
+                    error_log(f"Error insertando item {put['PutRequest']['Item']}: {e}")
+                    if not _es_error_de_item(e):
+                        break
+                except Exception as e:
+                    error_log(f"Error insertando item {put['PutRequest']['Item']}: {e}")
+                    break
+        except Exception as e:
+            # Throttling persistente (UnprocessedItems) u otro error: no reintentar
+            error_log(f"Error insertando lote de {len(lote)} items, se omite: {e}")
+    log(f"Shard insertado: {count} items")
+    return count
+
+def insertar_items(items):
+    """Inserta items ya convertidos con convert_item_to_decimal_inplace
+    (TypeSerializer rechaza floats; esos items se registran y se omiten)."""
+    log(f"Insertando {len(items)} items en DynamoDB...")
+    # Mismo id -> mismo shard, para poder eliminar duplicados dentro del shard
+    shards = [[] for _ in range(INSERT_WORKERS)]
+    for item in items:
+        shards[hash(str(item.get("id"))) % INSERT_WORKERS].append(item)
+    shards = [sh for sh in shards if sh]
+    count = 0
+    if shards:
+        with ThreadPoolExecutor(max_workers=len(shards)) as ex:
+            count = sum(ex.map(_insertar_shard, shards))
     log(f"Total insertados: {count}")
     return count
 
@@ -121,9 +293,9 @@ def obtener_sismos_por_anio(year):
     url = f"https://ultimosismo.igp.gob.pe/api/ultimo-sismo/ajaxb/{year}"
     log(f"Solicitando datos al IGP para el año {year}...")
     try:
-        r = requests.get(url, timeout=15)
+        r = SESSION.get(url, timeout=15)
         if r.status_code == 200:
-            data = r.json()
+            data = json_loads(r.content)
             log(f"Datos obtenidos para {year}: {len(data)} items")
             return {"ok": True, "items": data}
         elif r.status_code == 404:
@@ -142,14 +314,14 @@ def http_ok(data):
     return {
         "statusCode": 200,
         "headers": {"Content-Type": "application/json"},
-        "body": json.dumps(data, ensure_ascii=False)
+        "body": json_dumps(data)
     }
 
 def http_error(msg):
     return {
         "statusCode": 500,
         "headers": {"Content-Type": "application/json"},
-        "body": json.dumps({"error": msg}, ensure_ascii=False)
+        "body": json_dumps({"error": msg})
     }
 
 # -----------------------
@@ -175,24 +347,48 @@ def lambda_handler(event, context):
         resumen = {"years_processed": [], "total_inserted": 0, "errors": []}
         all_items_to_insert = []
 
-        for year in range(start, end + 1):
-            resp = obtener_sismos_por_anio(year)
+        years = range(start, end + 1)
+        respuestas = {}
+        with ThreadPoolExecutor(max_workers=min(8, len(years))) as ex:
+            futs = {ex.submit(obtener_sismos_por_anio, y): y for y in years}
+            for fut in as_completed(futs):
+                respuestas[futs[fut]] = fut.result()
+
+        procesado_en = _to_z(datetime.now(timezone.utc))
+        # Referencias locales para el bucle por registro
+        _dict = dict
+        _uuid4 = uuid.uuid4
+        _unir = unir_fecha_hora
+        _conv = convert_item_to_decimal_inplace
+        for year in years:
+            resp = respuestas[year]
             if not resp["ok"]:
                 resumen["errors"].append({"year": year, "error": resp.get("error")})
                 continue
             items = resp["items"]
             processed = []
+            append = processed.append
             for rec in items:
-                r = dict(rec)
-                r.setdefault("id", str(uuid.uuid4()))
+                r = _dict(rec)
+                if "id" not in r:
+                    r["id"] = str(_uuid4())
                 fecha_local = r.get("fecha_local")
                 hora_local = r.get("hora_local")
-                r["fecha_hora_local"] = unir_fecha_hora(fecha_local, hora_local)
-                r["procesado_en"] = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
-                processed.append(r)
+                r["fecha_hora_local"] = _unir(fecha_local, hora_local)
+                r["procesado_en"] = procesado_en
+                try:
+                    _conv(r)
+                except Exception as e:
+                    error_log(f"Error convirtiendo item {r}: {e}")
+                    continue
+                append(r)
             all_items_to_insert.extend(processed)
             resumen["years_processed"].append({"year": year, "count": len(processed)})
 
+        if not all_items_to_insert:
+            log("Sin datos nuevos: se conserva la tabla actual")
+            return http_ok(resumen)
+
         try:
             limpiar_tabla()
         except Exception as e:
@@ -213,3 +409,5 @@ def lambda_handler(event, context):
         error_log("Excepción no manejada:", e)
         return http_error(f"Error inesperado: {e}")
 
+# Se crea el cliente en el cold start, tras el resto de la inicialización
+_get_client()